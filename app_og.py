@@ -12,68 +12,322 @@ This file is intentionally compact and human-readable so a reviewer can follow t
 """
 
 import asyncio
+import logging
+import operator
 import uuid
-import copy
-from typing import Dict, Any, Optional
+from collections import ChainMap, OrderedDict
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import numpy as np
+import orjson
+from numba import njit, prange
 from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, PrivateAttr
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Mini Workflow Engine — Data Quality Pipeline")
 
 # -------------------------
 # In-memory stores
 # -------------------------
-GRAPHS: Dict[str, Dict[str, Any]] = {}   # graph_id -> graph definition
-RUNS: Dict[str, Dict[str, Any]] = {}     # run_id -> {"state":..., "log": [...], "status": ...}
+GRAPHS: Dict[str, "GraphDef"] = {}      # graph_id -> validated graph definition
+class RunRec:
+    """One run's record; __slots__ keeps it small and makes field writes plain slot stores."""
+    __slots__ = ("state", "log", "status", "integral", "version", "rules_cache")
+
+    def __init__(self, state: Dict[str, Any], status: str = "running"):
+        self.state = state
+        self.log: List[str] = []
+        self.status = status
+        self.integral = False  # input data was all ints: emit ints again (see _public_state)
+        self.version = 0  # bumped by tools on change; read by the engine's fixed-point check
+        self.rules_cache: Optional[Tuple[Any, List[Dict[str, Any]]]] = None  # generate_rules' (key, rules)
+
+# run being executed by the current task; tools only see the state, so _bump finds the record here
+_CURRENT_RUN: ContextVar[Optional[RunRec]] = ContextVar("current_run", default=None)
+
+class ShardedRunStore:
+    """
+    run_id -> RunRec, split across N shards so concurrent runs touch disjoint
+    (smaller) tables. Each shard keeps running records in a plain dict, never
+    evicted, and settled ones in an OrderedDict LRU capped at cap_per_shard;
+    settle() moves a record across once its run ends and evicts in O(1).
+    """
+    __slots__ = ("_running", "_settled", "_cap")
+
+    def __init__(self, shards: int = 16, cap_per_shard: int = 4096):
+        self._running: List[Dict[str, RunRec]] = [{} for _ in range(shards)]
+        self._settled: List["OrderedDict[str, RunRec]"] = [OrderedDict() for _ in range(shards)]
+        self._cap = cap_per_shard
+
+    def _index(self, run_id: str) -> int:
+        return hash(run_id) % len(self._running)
+
+    def __getitem__(self, run_id: str) -> RunRec:
+        rec = self.get(run_id)
+        if rec is None:
+            raise KeyError(run_id)
+        return rec
+
+    def __setitem__(self, run_id: str, rec: RunRec) -> None:
+        i = self._index(run_id)
+        self._settled[i].pop(run_id, None)
+        self._running[i][run_id] = rec
+        if rec.status != "running":
+            self.settle(run_id)
+
+    def __contains__(self, run_id: str) -> bool:
+        i = self._index(run_id)
+        return run_id in self._running[i] or run_id in self._settled[i]
+
+    def get(self, run_id: str, default: Optional[RunRec] = None) -> Optional[RunRec]:
+        i = self._index(run_id)
+        rec = self._running[i].get(run_id)
+        if rec is not None:
+            return rec
+        settled = self._settled[i]
+        rec = settled.get(run_id)
+        if rec is None:
+            return default
+        settled.move_to_end(run_id)
+        return rec
+
+    def settle(self, run_id: str) -> None:
+        """Move a run that has ended into its shard's LRU, evicting the oldest settled runs past the cap."""
+        i = self._index(run_id)
+        rec = self._running[i].pop(run_id, None)
+        if rec is None:
+            return
+        settled = self._settled[i]
+        settled[run_id] = rec
+        while len(settled) > self._cap:
+            old_id, _ = settled.popitem(last=False)
+            logger.info("Evicted run %s (over %d settled runs in its shard)", old_id, self._cap)
+
+RUNS = ShardedRunStore()                 # run_id -> RunRec(state, log, status)
+
+# -------------------------
+# JIT kernels (numeric inner loops, compiled once and cached on disk)
+# -------------------------
+# fastmath minus "nnan"/"ninf": the kernels rely on NaN meaning "null"
+_JIT_OPTS = dict(cache=True, fastmath={"nsz", "arcp", "contract", "afn", "reassoc"}, boundscheck=False)
+
+@njit(**_JIT_OPTS)
+def _profile_kernel(arr):
+    nulls = 0
+    for i in range(arr.size):
+        if np.isnan(arr[i]):
+            nulls += 1
+    return nulls
+
+@njit(**_JIT_OPTS)
+def _detect_kernel(arr, low, high, samples):
+    # counts out-of-bounds values and writes the first len(samples) of them into the
+    # caller's pre-sized buffer, instead of materialising a full mask and arr[mask]
+    count = 0
+    for i in range(arr.size):
+        v = arr[i]
+        if v < low or v > high:  # NaN compares False, so nulls are never flagged
+            if count < samples.size:
+                samples[count] = v
+            count += 1
+    return count
+
+@njit(**_JIT_OPTS)
+def _fits_int16_kernel(arr):
+    # one fused pass that bails at the first block holding a null, out-of-range or
+    # fractional value, so data that can't be quantized usually costs one block;
+    # the inner loop is branch-free so LLVM can vectorize it
+    n = arr.size
+    for start in range(0, n, 4096):
+        ok = True
+        for i in range(start, min(start + 4096, n)):
+            v = arr[i]
+            ok &= (-32768.0 <= v) & (v <= 32767.0) & (v == np.floor(v))  # NaN fails the range test
+        if not ok:
+            return False
+    return n > 0
+
+@njit(parallel=True, **_JIT_OPTS)
+def _apply_kernel(arr, low, high, fill):
+    # elementwise and independent, so prange splits it across cores;
+    # nulls take the fill value as-is, everything else is max(low, min(high, v))
+    # (that order also decides inverted bounds: low wins, as in the plain-Python version)
+    out = np.empty_like(arr)
+    fills = not np.isnan(fill)
+    changed = 0
+    for i in prange(arr.size):
+        v = arr[i]
+        if np.isnan(v):
+            if fills:
+                out[i] = fill
+                changed += 1
+            else:
+                out[i] = v
+        else:
+            c = max(low, min(high, v))
+            out[i] = c
+            if c != v:
+                changed += 1
+    return out, changed
+
+# pay the compile / cache-load cost at import time rather than inside the first run
+# (float64 for data with nulls, int64 for plain ints, int16 for quantized data — see _quantize)
+_profile_kernel(np.zeros(2))
+_fits_int16_kernel(np.zeros(2))
+_fits_int16_kernel(np.zeros(2, dtype=np.int64))
+for _warm in (np.zeros(2), np.zeros(2, dtype=np.int64), np.zeros(2, dtype=np.int16)):
+    _detect_kernel(_warm, 0.0, 1.0, np.empty(1, dtype=_warm.dtype))
+    _apply_kernel(_warm, 0.0, 1.0, 0.0)
+del _warm
 
 # -------------------------
 # Tool registry (small, deterministic, rule-based)
 # -------------------------
+def _bump() -> None:
+    """Record that a tool changed the state of the current run (no-op outside a run)."""
+    rec = _CURRENT_RUN.get()
+    if rec is not None:
+        rec.version += 1
+
+def _store(state: Dict[str, Any], key: str, value: Any) -> None:
+    """Set state[key], bumping the version only when the value actually differs."""
+    if state.get(key) != value:
+        state[key] = value
+        _bump()
+
+_EXACT_INT_IN_FLOAT = 2 ** 53
+
+def _to_array(data: List[Any]) -> Tuple[Optional[np.ndarray], bool]:
+    """
+    Lossless ndarray form of a JSON data list, plus whether its values were all ints:
+      - ints only             -> int64
+      - ints/floats and None  -> float64 with NaN for None
+    Returns (None, False) when no lossless form exists (bools, strings, nested lists,
+    ints beyond int64, or beyond 2**53 next to floats/None); the tools then run their
+    plain-Python path over the list.
+    """
+    has_float = has_null = big = False
+    for v in data:
+        t = type(v)
+        if t is int:
+            if not -_EXACT_INT_IN_FLOAT <= v <= _EXACT_INT_IN_FLOAT:
+                big = True
+        elif t is float:
+            has_float = True
+        elif v is None:
+            has_null = True
+        else:
+            return None, False
+    if not has_float and not has_null:
+        try:
+            return np.array(data, dtype=np.int64), True
+        except OverflowError:
+            return None, False
+    if big:
+        return None, False
+    return np.array(data, dtype=np.float64), not has_float
+
+def _fits(x: float, dtype: Any) -> bool:
+    """True if x is an integer representable in the integer dtype."""
+    info = np.iinfo(dtype)
+    return float(x).is_integer() and info.min <= x <= info.max
+
+def _quantize(state: Dict[str, Any], arr: np.ndarray) -> np.ndarray:
+    """
+    Downcast null-free, integral int64/float64 data that fits int16 (4x less bandwidth
+    per pass). Storage only: _public_state derives client types from the run, not the dtype.
+    """
+    if arr.dtype not in (np.float64, np.int64) or not _fits_int16_kernel(arr):
+        return arr
+    q = arr.astype(np.int16)
+    state["data"] = q
+    return q
+
 def profile_data_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     """Compute simple profile metrics: row count and null count."""
-    data = state.get("data", [])
-    n = len(data)
-    nulls = sum(1 for v in data if v is None)
-    state["profile"] = {"rows": n, "nulls": nulls}
+    arr = state.get("data", [])
+    if not isinstance(arr, np.ndarray):
+        _store(state, "profile", {"rows": len(arr), "nulls": sum(1 for v in arr if v is None)})
+        return state
+    nulls = int(_profile_kernel(arr)) if arr.dtype.kind == "f" else 0  # integer data has no nulls
+    if not nulls:
+        arr = _quantize(state, arr)
+    _store(state, "profile", {"rows": int(arr.size), "nulls": nulls})
     return state
 
 def detect_anomalies_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     """Detect values outside provided bounds (anomaly_bounds)."""
-    data = state.get("data", [])
+    arr = state.get("data", [])
     low, high = state.get("anomaly_bounds", (0, 100))
-    anomalies = [v for v in data if v is not None and (v < low or v > high)]
-    state["anomalies"] = {"count": len(anomalies), "values": anomalies[:10]}
+    if not isinstance(arr, np.ndarray):
+        anomalies = [v for v in arr if v is not None and (v < low or v > high)]
+        _store(state, "anomalies", {"count": len(anomalies), "values": anomalies[:10]})
+        return state
+    samples = np.empty(10, dtype=arr.dtype)  # same dtype as data, so int16 data reports ints
+    count = _detect_kernel(arr, float(low), float(high), samples)
+    _store(state, "anomalies", {"count": int(count), "values": samples[:count].tolist()})
     return state
 
 def generate_rules_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     """Generate simple remediation rules based on profile/anomalies."""
+    has_nulls = state.get("profile", {}).get("nulls", 0) > 0
+    has_anomalies = state.get("anomalies", {}).get("count", 0) > 0
+    low, high = state.get("anomaly_bounds", (0, 100))
+    # the rules depend only on these; skip the rebuild when a loop revisits this node unchanged
+    key = (has_nulls, has_anomalies, low, high)
+    rec = _CURRENT_RUN.get()
+    cached = rec.rules_cache if rec is not None else None
+    if cached and cached[0] == key and state.get("rules") is cached[1]:
+        return state
     rules = []
-    if state.get("profile", {}).get("nulls", 0) > 0:
+    if has_nulls:
         rules.append({"name": "fill_null", "action": "fill", "value": 0})
-    if state.get("anomalies", {}).get("count", 0) > 0:
-        low, high = state.get("anomaly_bounds", (0, 100))
+    if has_anomalies:
         rules.append({"name": "clip", "action": "clip", "low": low, "high": high})
-    state["rules"] = rules
+    _store(state, "rules", rules)
+    if rec is not None:
+        rec.rules_cache = (key, state["rules"])
     return state
 
 def apply_rules_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     """Apply the generated rules to the data (fill nulls, clip outliers)."""
-    data = state.get("data", [])
-    new_data = []
+    arr = state.get("data", [])
     rules = state.get("rules", [])
-    for v in data:
-        if v is None:
-            fill_rule = next((r for r in rules if r.get("name") == "fill_null"), None)
-            new_data.append(fill_rule["value"] if fill_rule else v)
-            continue
-        clip_rule = next((r for r in rules if r.get("name") == "clip"), None)
-        if clip_rule:
-            low, high = clip_rule["low"], clip_rule["high"]
-            # clip to bounds
-            new_data.append(max(low, min(high, v)))
+    rules_by_name = {r.get("name"): r for r in reversed(rules)}  # first rule of a name wins
+    fill_rule = rules_by_name.get("fill_null")
+    clip_rule = rules_by_name.get("clip")
+    if isinstance(arr, np.ndarray) and arr.dtype.kind == "i" and clip_rule and not (
+        _fits(clip_rule["low"], arr.dtype) and _fits(clip_rule["high"], arr.dtype)
+    ):
+        # bounds not representable in the integer dtype: go through float64 when that is exact
+        if arr.size and np.abs(arr).max() > _EXACT_INT_IN_FLOAT:
+            arr = arr.tolist()
         else:
-            new_data.append(v)
-    state["data"] = new_data
+            arr = arr.astype(np.float64)
+    if not isinstance(arr, np.ndarray):
+        new_data = [None] * len(arr)
+        for i, v in enumerate(arr):
+            if v is None:
+                new_data[i] = fill_rule["value"] if fill_rule else v
+            elif clip_rule:
+                new_data[i] = max(clip_rule["low"], min(clip_rule["high"], v))
+            else:
+                new_data[i] = v
+        if new_data != arr:
+            state["data"] = new_data
+            _bump()
+        return state
+    # no rule -> identity: NaN fill keeps nulls, infinite bounds never clip
+    fill = float(fill_rule["value"]) if fill_rule else np.nan
+    low, high = (float(clip_rule["low"]), float(clip_rule["high"])) if clip_rule else (-np.inf, np.inf)
+    new_data, changed = _apply_kernel(arr, low, high, fill)
+    if changed:
+        state["data"] = new_data
+        _bump()
     return state
 
 TOOLS: Dict[str, Any] = {
@@ -91,13 +345,15 @@ class GraphDef(BaseModel):
     edges: Dict[str, str]                 # from_node -> to_node
     start_node: str
     loop_condition: Optional[Dict[str, Any]] = None  # e.g. {"metric": "anomalies.count", "op": "<=", "value": 1}
+    _check: Optional[Callable[[Dict[str, Any]], Tuple[bool, Any]]] = PrivateAttr(default=None)  # compiled loop_condition
+    _program: List[Tuple[str, Optional[str], Any, int]] = PrivateAttr(default_factory=list)  # see _compile_program
+    _start: int = PrivateAttr(default=-1)
 
 # -------------------------
 # Helpers
 # -------------------------
-def _resolve_metric(state: Dict[str, Any], metric_path: str):
-    """Resolve dotted metric path like 'anomalies.count' in state safely."""
-    parts = metric_path.split(".")
+def _resolve_metric(state: Dict[str, Any], parts: Tuple[str, ...]):
+    """Resolve a pre-split metric path like ('anomalies', 'count') in state safely."""
     cur = state
     for p in parts:
         if cur is None:
@@ -105,108 +361,197 @@ def _resolve_metric(state: Dict[str, Any], metric_path: str):
         cur = cur.get(p)
     return cur
 
+def _resolve2(state: Dict[str, Any], first: str, second: str):
+    """Two-part fast path of _resolve_metric (the common 'anomalies.count' shape)."""
+    cur = state.get(first)
+    return None if cur is None else cur.get(second)
+
+# loop_condition "op" -> comparison; unknown ops never satisfy the condition
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "<=": operator.le,
+    "<": operator.lt,
+    ">=": operator.ge,
+    ">": operator.gt,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+def _compile_condition(loop_cond: Optional[Dict[str, Any]]) -> Callable[[Dict[str, Any]], Tuple[bool, Any]]:
+    """Specialize a loop_condition once into check(state) -> (satisfied, metric_val)."""
+    if not loop_cond:
+        return lambda state: (False, None)
+    parts = tuple(loop_cond["metric"].split("."))
+    op_fn = _OPS.get(loop_cond["op"])
+    target = loop_cond["value"]
+
+    if len(parts) == 2:
+        first, second = parts
+
+        def check(state: Dict[str, Any]) -> Tuple[bool, Any]:
+            metric_val = _resolve2(state, first, second)
+            if metric_val is None or op_fn is None:
+                return False, metric_val
+            return op_fn(metric_val, target), metric_val
+    else:
+        def check(state: Dict[str, Any]) -> Tuple[bool, Any]:
+            metric_val = _resolve_metric(state, parts)
+            if metric_val is None or op_fn is None:
+                return False, metric_val
+            return op_fn(metric_val, target), metric_val
+
+    return check
+
+def _compile_program(g: GraphDef) -> Tuple[List[Tuple[str, Optional[str], Any, int]], int]:
+    """
+    Flatten nodes/edges into an index-addressed program of
+    (node_name, tool_name, tool_fn, next_idx) entries plus the start index.
+    Tools and successors are resolved here once; -1 means "no next node".
+    Unknown nodes/tools are kept (tool_fn=None) so the run fails with the usual log line.
+    """
+    names: Dict[str, int] = {}
+    for name in (g.start_node, *g.nodes, *g.edges, *g.edges.values()):
+        if name and name not in names:
+            names[name] = len(names)
+    program = []
+    for name in names:
+        tool_name = g.nodes.get(name)
+        next_node = g.edges.get(name)
+        program.append((name, tool_name, TOOLS.get(tool_name), names[next_node] if next_node else -1))
+    return program, names.get(g.start_node, -1)
+
+def _signature(rec: RunRec) -> Tuple[Any, ...]:
+    """
+    O(1) fixed-point summary of a state, compared between steps instead of the
+    state itself. The version counter covers the built-in tools; the small
+    summaries also catch a registered tool that rewrites them without bumping it.
+    The data array itself is left out: quantization swaps it for a new object
+    without changing its contents, which must not count as progress.
+    """
+    state = rec.state
+    return (
+        rec.version,
+        state.get("profile"),
+        (state.get("anomalies") or {}).get("count"),
+    )
+
+def _public_values(arr: np.ndarray, integral: bool) -> List[Any]:
+    """
+    JSON list for an ndarray whose type never depends on its dtype: ints for whole
+    values when the run's input was all ints, floats otherwise, and NaN -> None.
+    """
+    if arr.dtype.kind != "f":
+        return arr.tolist() if integral else arr.astype(np.float64).tolist()
+    nulls = np.isnan(arr)
+    whole = (arr == np.floor(arr)) & (np.abs(arr) < 2.0 ** 63) if integral else None
+    if whole is not None and whole.all():
+        return arr.astype(np.int64).tolist()
+    if whole is None and not nulls.any():
+        return arr.tolist()
+    out = arr.astype(object)
+    if whole is not None:
+        out[whole] = arr[whole].astype(np.int64)
+    out[nulls] = None
+    return out.tolist()
+
+def _public_state(state: Dict[str, Any], integral: bool) -> Dict[str, Any]:
+    """Client view of the state, with ndarray data (and its anomaly samples) turned back into plain JSON lists."""
+    out = dict(state)
+    data = out.get("data")
+    if isinstance(data, np.ndarray):
+        out["data"] = _public_values(data, integral)
+        anomalies = out.get("anomalies")
+        if anomalies and anomalies.get("values"):
+            out["anomalies"] = dict(anomalies, values=_public_values(np.asarray(anomalies["values"]), integral))
+    return out
+
 # -------------------------
 # Core execution engine
 # -------------------------
-async def execute_graph(graph_id: str, run_id: str):
+async def execute_graph(graph_id: str, run_id: str, yield_between_nodes: bool = True):
     """
     Execute the graph step-by-step.
+    Background runs yield to the event loop between nodes; run_sync passes
+    yield_between_nodes=False and runs straight through.
     After each node executes we:
-      - update RUNS store
+      - update the run record (bound once; tools mutate its state in place)
       - evaluate loop_condition immediately and stop if satisfied
       - stop if state doesn't change (safety)
     """
-    graph = GRAPHS[graph_id]
-    state = RUNS[run_id]["state"]
-    log = RUNS[run_id]["log"]
-    current = graph["start_node"]
+    rec = RUNS[run_id]
+    token = _CURRENT_RUN.set(rec)
+    try:
+        await _run_program(GRAPHS[graph_id], rec, yield_between_nodes)
+    finally:
+        _CURRENT_RUN.reset(token)
+        RUNS.settle(run_id)
+
+async def _run_program(graph: "GraphDef", rec: RunRec, yield_between_nodes: bool) -> None:
+    """execute_graph's step loop over the compiled program."""
+    state = rec.state
+    log = rec.log  # appended in place; readers snapshot it themselves
+    check = graph._check
+    program = graph._program
+    idx = graph._start
     visited = 0
     MAX_STEPS = 200
 
-    def _condition_satisfied(snap: Dict[str, Any]):
-        loop_cond = graph.get("loop_condition")
-        if not loop_cond:
-            return False, None
-        metric_val = _resolve_metric(snap, loop_cond["metric"])
-        op = loop_cond["op"]
-        target = loop_cond["value"]
-        if metric_val is None:
-            return False, metric_val
-        if op == "<=":
-            return (metric_val <= target), metric_val
-        if op == "<":
-            return (metric_val < target), metric_val
-        if op == ">=":
-            return (metric_val >= target), metric_val
-        if op == ">":
-            return (metric_val > target), metric_val
-        if op == "==":
-            return (metric_val == target), metric_val
-        if op == "!=":
-            return (metric_val != target), metric_val
-        return False, metric_val
-
-    prev_state = copy.deepcopy(state)
-
-    while current and visited < MAX_STEPS:
+    # convert data once to a lossless ndarray the tools' kernels can use (lists they can't stay as-is)
+    data = state.get("data")
+    if isinstance(data, list):
+        arr, rec.integral = _to_array(data)
+        if arr is not None:
+            state["data"] = arr
+
+    prev_sig = _signature(rec)
+
+    while idx >= 0 and visited < MAX_STEPS:
         visited += 1
-        tool_name = graph["nodes"].get(current)
+        current, tool_name, tool_fn, next_idx = program[idx]
         log.append(f"Running node: {current} -> {tool_name}")
-        tool_fn = TOOLS.get(tool_name)
         if not tool_fn:
             log.append(f"Missing tool: {tool_name}")
-            RUNS[run_id]["status"] = "failed"
-            RUNS[run_id]["log"] = log
+            rec.status = "failed"
             return
 
         # Execute tool (tools are synchronous functions here)
         try:
             result = tool_fn(state)
-            if result is not None:
+            if result is not None and result is not state:
+                # only a tool that hands back a new state object needs a store
                 state = result
+                rec.state = state
         except Exception as exc:
             log.append(f"Exception in {tool_name}: {repr(exc)}")
-            RUNS[run_id]["status"] = "failed"
-            RUNS[run_id]["log"] = log
-            RUNS[run_id]["state"] = state
+            rec.status = "failed"
             return
 
-        # push updates to run store
-        RUNS[run_id]["state"] = state
-        RUNS[run_id]["log"] = log.copy()
-
         # immediate loop-condition check
-        satisfied, metric_val = _condition_satisfied(state)
+        satisfied, metric_val = check(state)
         if satisfied:
-            log.append(f"Loop stop satisfied: {graph.get('loop_condition')} (metric={metric_val})")
-            RUNS[run_id]["status"] = "finished"
-            RUNS[run_id]["log"] = log
-            RUNS[run_id]["state"] = state
+            log.append(f"Loop stop satisfied: {graph.loop_condition} (metric={metric_val})")
+            rec.status = "finished"
             return
 
         # safety: if state didn't change, stop to avoid infinite loop
-        if state == prev_state:
+        sig = _signature(rec)
+        if sig == prev_sig:
             log.append("State unchanged — stopping to avoid infinite loop.")
-            RUNS[run_id]["status"] = "finished"
-            RUNS[run_id]["log"] = log
-            RUNS[run_id]["state"] = state
+            rec.status = "finished"
             return
 
-        prev_state = copy.deepcopy(state)
+        prev_sig = sig
 
         # advance to next node
-        next_node = graph["edges"].get(current)
-        if not next_node:
+        if next_idx < 0:
             break
-        current = next_node
-        await asyncio.sleep(0)
+        idx = next_idx
+        if yield_between_nodes:
+            await asyncio.sleep(0)
 
     # normal finish
-    if RUNS[run_id].get("status") != "failed":
-        RUNS[run_id]["status"] = "finished"
+    if rec.status != "failed":
+        rec.status = "finished"
         log.append("Execution finished")
-        RUNS[run_id]["log"] = log
-        RUNS[run_id]["state"] = state
 
 # -------------------------
 # FastAPI endpoints
@@ -214,7 +559,9 @@ async def execute_graph(graph_id: str, run_id: str):
 @app.post("/graph/create")
 async def create_graph(g: GraphDef):
     graph_id = str(uuid.uuid4())
-    GRAPHS[graph_id] = g.dict()
+    g._check = _compile_condition(g.loop_condition)
+    g._program, g._start = _compile_program(g)
+    GRAPHS[graph_id] = g
     return {"graph_id": graph_id}
 
 @app.post("/graph/run")
@@ -227,26 +574,44 @@ async def run_graph(payload: Dict[str, Any]):
 
     init_state = payload.get("initial_state", {})
     run_id = str(uuid.uuid4())
-    RUNS[run_id] = {"state": init_state, "log": [], "status": "running"}
+    # tools write into the empty overlay; the caller's initial_state is never mutated
+    RUNS[run_id] = RunRec(ChainMap({}, init_state))
 
     # run in background
     asyncio.create_task(execute_graph(graph_id, run_id))
     return {"run_id": run_id}
 
 
-@app.post("/graph/run_sync")
+class NumpyORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, which serializes ndarrays natively (NaN -> null)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def _respond(content: Dict[str, Any]) -> JSONResponse:
+    """Render with orjson; fall back to the stock encoder for what orjson rejects (e.g. ints > 64 bits)."""
+    try:
+        return NumpyORJSONResponse(content)
+    except orjson.JSONEncodeError:
+        return JSONResponse(jsonable_encoder(content))
+
+
+@app.post("/graph/run_sync", response_class=NumpyORJSONResponse)
 async def run_graph_sync(payload: Dict[str, Any]):
     graph_id = payload["graph_id"]
     init_state = payload.get("initial_state", {})
     run_id = str(uuid.uuid4())
-    RUNS[run_id] = {"state": init_state, "log": [], "status": "running"}
+    # tools write into the empty overlay; the caller's initial_state is never mutated
+    rec = RUNS[run_id] = RunRec(ChainMap({}, init_state))
     # run synchronously for debugging / demos
-    await execute_graph(graph_id, run_id)
-    return {"run_id": run_id, "state": RUNS[run_id]["state"], "log": RUNS[run_id]["log"], "status": RUNS[run_id]["status"]}
+    await execute_graph(graph_id, run_id, yield_between_nodes=False)
+    return _respond({"run_id": run_id, "state": _public_state(rec.state, rec.integral), "log": list(rec.log), "status": rec.status})
 
-@app.get("/graph/state/{run_id}")
+@app.get("/graph/state/{run_id}", response_class=NumpyORJSONResponse)
 async def get_run_state(run_id: str):
     run = RUNS.get(run_id)
     if not run:
-        return {"error": "run_id not found"}
-    return {"state": run["state"], "log": run["log"], "status": run["status"]}
+        return _respond({"error": "run_id not found"})
+    # returned directly so the polled state skips jsonable_encoder
+    return _respond({"state": _public_state(run.state, run.integral), "log": list(run.log), "status": run.status})
@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import app_og
+
+LINEAR = {
+    "nodes": {"p": "profile", "d": "detect_anomalies", "g": "generate_rules", "a": "apply_rules"},
+    "edges": {"p": "d", "d": "g", "g": "a"},
+    "start_node": "p",
+}
+DEMO_STATE = {"data": [1, None, 150, -5, 50], "anomaly_bounds": [0, 100]}
+
+
+@pytest.fixture
+def client():
+    return TestClient(app_og.app)
+
+
+def _typed(v):
+    """Tag every scalar with its type so 1 and 1.0 compare as different."""
+    if isinstance(v, dict):
+        return {k: _typed(x) for k, x in v.items()}
+    if isinstance(v, list):
+        return [_typed(x) for x in v]
+    return (type(v).__name__, v)
+
+
+def _run_sync(client, graph, initial_state):
+    graph_id = client.post("/graph/create", json=graph).json()["graph_id"]
+    resp = client.post("/graph/run_sync", json={"graph_id": graph_id, "initial_state": initial_state})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_demo_payload_matches_baseline(client):
+    # exact final state of the original pure-Python implementation for the demo payload
+    body = _run_sync(client, LINEAR, DEMO_STATE)
+    assert body["status"] == "finished"
+    assert _typed(body["state"]) == _typed({
+        "data": [1, 0, 100, 0, 50],
+        "anomaly_bounds": [0, 100],
+        "profile": {"rows": 5, "nulls": 1},
+        "anomalies": {"count": 2, "values": [150, -5]},
+        "rules": [
+            {"name": "fill_null", "action": "fill", "value": 0},
+            {"name": "clip", "action": "clip", "low": 0, "high": 100},
+        ],
+    })
+    assert body["log"] == [
+        "Running node: p -> profile",
+        "Running node: d -> detect_anomalies",
+        "Running node: g -> generate_rules",
+        "Running node: a -> apply_rules",
+        "Execution finished",
+    ]
+
+
+@pytest.mark.parametrize("data", [
+    [10**18 + 1, 5],      # exact only as int64
+    [10**20, 5],          # beyond int64: plain-Python path
+    [1, 2, True],         # bools are not numbers here
+    [1.5, 2.0, 3.25],     # floats stay floats
+])
+def test_untouched_data_round_trips_exactly(client, data):
+    body = _run_sync(client, LINEAR, {"data": data, "anomaly_bounds": [-10**21, 10**21]})
+    assert _typed(body["state"]["data"]) == _typed(data)
+
+
+def test_non_numeric_data_fails_the_run(client):
+    body = _run_sync(client, LINEAR, {"data": ["a", 1]})
+    assert body["status"] == "failed"
+    assert body["log"][-1].startswith("Exception in detect_anomalies")
+
+
+@pytest.mark.parametrize("values, expected", [
+    ([-32768, 0, 32767], True),
+    ([1.0, 2.0], True),
+    ([32768], False),        # out of range
+    ([1.0, 2.5], False),     # fractional
+    ([1.0, float("nan")], False),
+    ([], False),
+])
+def test_fits_int16_kernel(values, expected):
+    dtype = np.int64 if all(type(v) is int for v in values) and values else np.float64
+    assert app_og._fits_int16_kernel(np.array(values, dtype=dtype)) is expected
+
+
+@pytest.mark.parametrize("initial_state, stored, data, values", [
+    # integral: quantized to int16, still ints to clients
+    ({"data": [1, 2, 300]}, np.int16, [1, 2, 100], [300]),
+    # integral-valued floats: quantized, but clients still get floats
+    ({"data": [1.0, 2.0, 300.0]}, np.int16, [1.0, 2.0, 100.0], [300.0]),
+    # fractional: not quantized
+    ({"data": [1.5, 2.0, 300.0]}, np.float64, [1.5, 2.0, 100.0], [300.0]),
+    # out of int16 range: kept as int64
+    ({"data": [40000, 5, -1]}, np.int64, [100, 5, 0], [40000, -1]),
+    # inverted bounds: low wins, as max(low, min(high, v)) did
+    ({"data": [1, 2, 300], "anomaly_bounds": [10, 5]}, np.int16, [10, 10, 10], [1, 2, 300]),
+    # fractional bounds on int16 data: promoted to float64 for the clip
+    ({"data": [1, 2, 300], "anomaly_bounds": [0.5, 100.5]}, np.float64, [1, 2, 100.5], [300]),
+])
+def test_int16_paths_keep_client_types(client, initial_state, stored, data, values):
+    body = _run_sync(client, LINEAR, initial_state)
+    assert body["status"] == "finished"
+    assert app_og.RUNS[body["run_id"]].state["data"].dtype == stored
+    assert _typed(body["state"]["data"]) == _typed(data)
+    assert _typed(body["state"]["anomalies"]["values"]) == _typed(values)
+
+
+def test_graph_without_profile_keeps_client_types(client):
+    graph = {
+        "nodes": {"d": "detect_anomalies", "g": "generate_rules", "a": "apply_rules"},
+        "edges": {"d": "g", "g": "a"},
+        "start_node": "d",
+    }
+    body = _run_sync(client, graph, {"data": [1, None, 150]})
+    assert _typed(body["state"]["data"]) == _typed([1, None, 100])
+    assert _typed(body["state"]["anomalies"]["values"]) == _typed([150])
+
+
+def test_wide_ints_serialize_on_both_endpoints(client):
+    # orjson rejects ints beyond 64 bits; both endpoints fall back to the stock encoder
+    body = _run_sync(client, LINEAR, {"data": [1], "meta": 10**20})
+    assert body["state"]["meta"] == 10**20
+    resp = client.get(f"/graph/state/{body['run_id']}")
+    assert resp.status_code == 200
+    assert resp.json()["state"] == body["state"]
+
+
+def test_user_version_key_is_left_alone(client):
+    # the engine's change counter lives on the run record, not in the state
+    body = _run_sync(client, LINEAR, dict(DEMO_STATE, _version="v1"))
+    assert body["status"] == "finished"
+    assert body["state"]["_version"] == "v1"
+    assert body["state"]["data"] == [1, 0, 100, 0, 50]
+
+
+def test_user_rules_cache_key_is_left_alone(client):
+    body = _run_sync(client, LINEAR, dict(DEMO_STATE, _rules_cache_key="mine"))
+    assert body["state"]["_rules_cache_key"] == "mine"
+    assert body["state"]["data"] == [1, 0, 100, 0, 50]
+
+
+def test_run_store_evicts_settled_runs_past_the_cap(caplog):
+    store = app_og.ShardedRunStore(shards=1, cap_per_shard=2)
+    for i in range(5):
+        store[f"r{i}"] = app_og.RunRec({})
+    with caplog.at_level("INFO", logger="app_og"):
+        for i in range(3):
+            store[f"r{i}"].status = "finished"
+            store.settle(f"r{i}")
+    # oldest settled run goes; running ones are kept however many there are
+    assert "r0" not in store and store.get("r0") is None
+    assert all(f"r{i}" in store for i in range(1, 5))
+    assert "Evicted run r0" in caplog.text
+    store.settle("r3")
+    assert "r1" not in store and "r3" in store